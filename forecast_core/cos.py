@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+import threading
+
+# --- IBM Cloud Object Storage (COS) 用の設定 -----------------------------
+
+try:
+    import ibm_boto3
+    from ibm_boto3.s3.transfer import TransferConfig
+    from ibm_botocore.client import Config as IBMConfig
+
+    _HAS_COS = True
+except ImportError:
+    ibm_boto3 = None  # type: ignore[assignment]
+    TransferConfig = None  # type: ignore[assignment]
+    IBMConfig = None  # type: ignore[assignment]
+    _HAS_COS = False
+
+
+# クラウド環境（Code Engine）向け設定
+# 環境変数から読み込みます。設定がない場合は None となります。
+COS_CONFIG = {
+    "ENDPOINT": os.getenv("COS_ENDPOINT"),
+    "API_KEY_ID": os.getenv("COS_HMAC_ACCESS_KEY_ID"),
+    "SECRET_ACCESS_KEY": os.getenv("COS_HMAC_SECRET_ACCESS_KEY"),
+    "BUCKET_DEFAULT": os.getenv("COS_BUCKET", "bucket-networld-forecast-01")
+}
+
+# プロセス内で共有するクライアント（get_cos_client 経由で生成する）
+_client = None
+_client_lock = threading.Lock()
+
+
+def transfer_config():
+    """
+    download_fileobj 用の転送設定。
+    8MB 単位のレンジ GET を並列に発行し、ネットワーク待ちと書き込みを重ねる。
+    """
+    return TransferConfig(
+        multipart_threshold=8 * 1024 * 1024,
+        multipart_chunksize=8 * 1024 * 1024,
+        max_concurrency=10,
+        io_chunksize=1024 * 1024,
+    )
+
+
+def get_cos_client():
+    """
+    IBM Cloud Object Storage のクライアントを返す。
+    - プロセス内で 1 つだけ作成して共有し、接続プール（TLS 接続）を呼び出し間で再利用する。
+    - クライアントはスレッドセーフなので、並列ダウンロード / アップロードからも共用できる。
+    環境変数 (COS_ENDPOINT 等) が設定されていない場合はエラーとします。
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_cos_client()
+    return _client
+
+
+def _create_cos_client():
+    """
+    IBM Cloud Object Storage のクライアントを作成する（get_cos_client から 1 回だけ呼ばれる）。
+    """
+    if not _HAS_COS:
+        raise RuntimeError(
+            "ibm-cos-sdk がインストールされていません。"
+            "COS 連携を使う場合は `pip install ibm-cos-sdk` を実行してください。"
+        )
+
+    # 必須変数のチェック
+    if not COS_CONFIG["ENDPOINT"] or not COS_CONFIG["API_KEY_ID"] or not COS_CONFIG["SECRET_ACCESS_KEY"]:
+        raise RuntimeError(
+            "COS の認証情報が環境変数に設定されていません。"
+            "クラウド環境(Code Engine等)の環境変数設定で "
+            "COS_ENDPOINT, COS_HMAC_ACCESS_KEY_ID, COS_HMAC_SECRET_ACCESS_KEY を指定してください。"
+        )
+
+    return ibm_boto3.client(
+        service_name="s3",
+        aws_access_key_id=COS_CONFIG["API_KEY_ID"],
+        aws_secret_access_key=COS_CONFIG["SECRET_ACCESS_KEY"],
+        endpoint_url=COS_CONFIG["ENDPOINT"],
+        config=IBMConfig(
+            signature_version="s3v4",
+            # 並列アップロード + レンジ GET の同時接続数をまかなえるだけのプールを確保
+            max_pool_connections=32,
+            retries={"max_attempts": 5, "mode": "adaptive"},
+            tcp_keepalive=True,
+        ),
+    )
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+from functools import lru_cache
 from pathlib import Path
 import io
-import os
+import tempfile
 
 import pandas as pd
 
+from forecast_core.cos import COS_CONFIG, get_cos_client, transfer_config
+
 # --- ローカルファイル用の基本設定 -----------------------------------------
 
 # プロジェクトルート配下の data / output を想定
@@ -13,6 +16,94 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = BASE_DIR / "data"
 OUTPUT_DIR = BASE_DIR / "output"
 
+# Excel 出力は openpyxl ではなく xlsxwriter で書き出す（ワークブック全体を
+# オブジェクトとして組み立てないぶん高速）。
+# ※ constant_memory は pandas の列順書き込みと両立せずセルが欠落するため使わない
+EXCEL_ENGINE = "xlsxwriter"
+EXCEL_ENGINE_KWARGS = {"options": {"strings_to_urls": False}}
+
+# Excel 読み込みは、入手できれば Rust 実装の calamine を使う（openpyxl より大幅に高速）
+try:
+    import python_calamine  # noqa: F401
+
+    _HAS_CALAMINE = True
+except ImportError:
+    _HAS_CALAMINE = False
+
+EXCEL_READ_ENGINE = "calamine" if _HAS_CALAMINE else "openpyxl"
+
+# 文字列処理（.str.contains / .str.slice）を繰り返す列は、読み込み時に一度だけ
+# Arrow 文字列型へ変換しておく（pyarrow が無い環境では通常の string 型）
+try:
+    import pyarrow  # noqa: F401
+
+    _HAS_PYARROW = True
+except ImportError:
+    _HAS_PYARROW = False
+
+STRING_DTYPE = "string[pyarrow]" if _HAS_PYARROW else "string"
+
+# 後続の処理（logic.py）で使う列だけを読み込み、それ以外の列は解析しない
+QUOTES_COLS = frozenset([
+    "メーカ名",
+    "見積作成日",
+    "顧客名",
+    "担当営業",
+    "アシスタント名",
+    "見積No",
+    "版数",
+    "件名",
+    "メーカ型番",
+    "商品名",
+    "数量",
+    "小計",
+    "見積注意事項",
+    "納入期日",
+    "単価",
+    "原単価",
+    "粗利額",
+    "原価小計",
+    "粗利小計",
+    "確度",
+    "受注予定日",
+    "受注有無",
+    "エンドユーザー名",
+])
+MASTER_COLS = frozenset(["パーツ番号", "ブランド", "ライセンス形態"])
+
+# 型が決まっている列は型推論を省略する
+QUOTES_READ_DTYPES = {"小計": "Float64"}
+
+QUOTES_STRING_COLS = ["メーカ型番"]
+MASTER_STRING_COLS = ["パーツ番号"]
+
+# 値の種類が少ない列は category 型にして、文字列のハッシュや PyObject の複製を避ける
+QUOTES_CATEGORY_COLS = ["メーカ名", "担当営業", "アシスタント名", "確度", "受注有無"]
+MASTER_CATEGORY_COLS = ["ブランド", "ライセンス形態"]
+
+
+def _select_columns(cols: frozenset[str]):
+    """
+    read_csv / read_excel の usecols に渡す判定関数を返す。
+    列名のリストを直接渡すと存在しない列でエラーになるため、関数で渡して
+    列が無い場合のエラーは logic 側のチェックに任せる。
+    """
+    return lambda c: c in cols
+
+
+def _optimize_dtypes(
+    df: pd.DataFrame,
+    string_cols: list[str],
+    category_cols: list[str],
+) -> pd.DataFrame:
+    """
+    string_cols を STRING_DTYPE に、category_cols を category 型に変換する。
+    df に存在しない列は無視する（列が無い場合のエラーは logic 側のチェックに任せる）。
+    """
+    dtypes = {c: STRING_DTYPE for c in string_cols if c in df.columns}
+    dtypes.update({c: "category" for c in category_cols if c in df.columns})
+    return df.astype(dtypes)
+
 
 def load_quotes() -> pd.DataFrame:
     """
@@ -24,7 +115,13 @@ def load_quotes() -> pd.DataFrame:
     if not path.exists():
         raise FileNotFoundError(f"見積データ.csv が見つかりません: {path}")
 
-    return pd.read_csv(path, encoding="cp932")
+    df = pd.read_csv(
+        path,
+        encoding="cp932",
+        usecols=_select_columns(QUOTES_COLS),
+        dtype=QUOTES_READ_DTYPES,
+    )
+    return _optimize_dtypes(df, QUOTES_STRING_COLS, QUOTES_CATEGORY_COLS)
 
 
 def load_part_master() -> pd.DataFrame:
@@ -35,7 +132,13 @@ def load_part_master() -> pd.DataFrame:
     if not path.exists():
         raise FileNotFoundError(f"型番検索表250905.xlsx が見つかりません: {path}")
 
-    return pd.read_excel(path, sheet_name="PA")
+    df = pd.read_excel(
+        path,
+        sheet_name="PA",
+        engine=EXCEL_READ_ENGINE,
+        usecols=_select_columns(MASTER_COLS),
+    )
+    return _optimize_dtypes(df, MASTER_STRING_COLS, MASTER_CATEGORY_COLS)
 
 
 def save_forecast(df: pd.DataFrame, filename: str = "forecast.xlsx") -> None:
@@ -45,7 +148,7 @@ def save_forecast(df: pd.DataFrame, filename: str = "forecast.xlsx") -> None:
     """
     OUTPUT_DIR.mkdir(exist_ok=True)
     path = OUTPUT_DIR / filename
-    df.to_excel(path, index=False)
+    df.to_excel(path, index=False, engine=EXCEL_ENGINE, engine_kwargs=EXCEL_ENGINE_KWARGS)
 
 
 def save_needs_review(df: pd.DataFrame, filename: str = "needs_review.xlsx") -> None:
@@ -54,58 +157,13 @@ def save_needs_review(df: pd.DataFrame, filename: str = "needs_review.xlsx") ->
     """
     OUTPUT_DIR.mkdir(exist_ok=True)
     path = OUTPUT_DIR / filename
-    df.to_excel(path, index=False)
+    df.to_excel(path, index=False, engine=EXCEL_ENGINE, engine_kwargs=EXCEL_ENGINE_KWARGS)
 
 
 # --- IBM Cloud Object Storage (COS) 用の設定 -----------------------------
 
-try:
-    import ibm_boto3
-    from ibm_botocore.client import Config as IBMConfig
-
-    _HAS_COS = True
-except ImportError:
-    ibm_boto3 = None  # type: ignore[assignment]
-    IBMConfig = None  # type: ignore[assignment]
-    _HAS_COS = False
-
-
-# クラウド環境（Code Engine）向け設定
-# 環境変数から読み込みます。設定がない場合は None となります。
-COS_CONFIG = {
-    "ENDPOINT": os.getenv("COS_ENDPOINT"),
-    "API_KEY_ID": os.getenv("COS_HMAC_ACCESS_KEY_ID"),
-    "SECRET_ACCESS_KEY": os.getenv("COS_HMAC_SECRET_ACCESS_KEY"),
-    "BUCKET_DEFAULT": os.getenv("COS_BUCKET", "bucket-networld-forecast-01")
-}
-
-
-def get_cos_client():
-    """
-    IBM Cloud Object Storage のクライアントを作成する。
-    環境変数 (COS_ENDPOINT 等) が設定されていない場合はエラーとします。
-    """
-    if not _HAS_COS:
-        raise RuntimeError(
-            "ibm-cos-sdk がインストールされていません。"
-            "COS 連携を使う場合は `pip install ibm-cos-sdk` を実行してください。"
-        )
-
-    # 必須変数のチェック
-    if not COS_CONFIG["ENDPOINT"] or not COS_CONFIG["API_KEY_ID"] or not COS_CONFIG["SECRET_ACCESS_KEY"]:
-        raise RuntimeError(
-            "COS の認証情報が環境変数に設定されていません。"
-            "クラウド環境(Code Engine等)の環境変数設定で "
-            "COS_ENDPOINT, COS_HMAC_ACCESS_KEY_ID, COS_HMAC_SECRET_ACCESS_KEY を指定してください。"
-        )
-
-    return ibm_boto3.client(
-        service_name="s3",
-        aws_access_key_id=COS_CONFIG["API_KEY_ID"],
-        aws_secret_access_key=COS_CONFIG["SECRET_ACCESS_KEY"],
-        endpoint_url=COS_CONFIG["ENDPOINT"],
-        config=IBMConfig(signature_version="s3v4"),
-    )
+# COS からのダウンロードで 1 ファイルをメモリ上に保持する上限（超えたら一時ファイルへ退避）
+SPOOL_MAX_SIZE = 32 * 1024 * 1024
 
 
 def load_quotes_from_cos(
@@ -119,11 +177,17 @@ def load_quotes_from_cos(
     cos = get_cos_client()
     bucket_name = bucket or COS_CONFIG["BUCKET_DEFAULT"]
 
+    # StreamingBody は bytes に読み切らずストリームのまま渡す。
+    # pandas はバイナリストリームと判定できず encoding を無視するため、
+    # TextIOWrapper で明示的にデコードする
     obj = cos.get_object(Bucket=bucket_name, Key=key)
-    raw = obj["Body"].read()
-    buf = io.BytesIO(raw)
 
-    return pd.read_csv(buf, encoding=encoding)
+    df = pd.read_csv(
+        io.TextIOWrapper(obj["Body"], encoding=encoding),
+        usecols=_select_columns(QUOTES_COLS),
+        dtype=QUOTES_READ_DTYPES,
+    )
+    return _optimize_dtypes(df, QUOTES_STRING_COLS, QUOTES_CATEGORY_COLS)
 
 
 def load_part_master_from_cos(
@@ -133,15 +197,51 @@ def load_part_master_from_cos(
 ) -> pd.DataFrame:
     """
     COS 上の 型番マスタExcel を読み込む。
+    - マスタはほとんど更新されないため、(バケット, キー, ETag) 単位でプロセス内にキャッシュする。
+    - 返す DataFrame はキャッシュと共有されるので、呼び出し側で変更しないこと。
     """
     cos = get_cos_client()
     bucket_name = bucket or COS_CONFIG["BUCKET_DEFAULT"]
 
-    obj = cos.get_object(Bucket=bucket_name, Key=key)
-    raw = obj["Body"].read()
-    buf = io.BytesIO(raw)
+    # HEAD だけで ETag を確認し、変わっていなければダウンロードも Excel 解析も省略する
+    head = cos.head_object(Bucket=bucket_name, Key=key)
+    return _load_part_master_cached(bucket_name, key, head["ETag"], sheet_name)
+
+
+@lru_cache(maxsize=8)
+def _load_part_master_cached(
+    bucket_name: str,
+    key: str,
+    etag: str,
+    sheet_name: str,
+) -> pd.DataFrame:
+    """
+    load_part_master_from_cos の本体（ETag をキーにキャッシュされる）。
+    """
+    cos = get_cos_client()
+
+    # Excel の読み込みにはシーク可能なファイルが必要なため、SpooledTemporaryFile に
+    # レンジ GET で並列ダウンロードしてから読み込む（大きい場合はディスクへ退避）
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as tmp:
+        cos.download_fileobj(bucket_name, key, tmp, Config=transfer_config())
+        tmp.seek(0)
+        df = pd.read_excel(
+            tmp,
+            sheet_name=sheet_name,
+            engine=EXCEL_READ_ENGINE,
+            usecols=_select_columns(MASTER_COLS),
+        )
+
+    return _optimize_dtypes(df, MASTER_STRING_COLS, MASTER_CATEGORY_COLS)
+
 
-    return pd.read_excel(buf, sheet_name=sheet_name)
+def _put_buffer(cos, bucket_name: str, key: str, buf: io.BytesIO) -> None:
+    """
+    メモリ上のバッファを COS に PUT する。
+    - getvalue() で bytes を複製せず、バッファをファイルライクなまま渡す。
+    """
+    buf.seek(0)
+    cos.put_object(Bucket=bucket_name, Key=key, Body=buf)
 
 
 def save_forecast_to_cos(
@@ -157,7 +257,73 @@ def save_forecast_to_cos(
 
     # DataFrame → Excelバイナリ（メモリ上）
     buf = io.BytesIO()
-    df.to_excel(buf, index=False)
-    buf.seek(0)
+    df.to_excel(buf, index=False, engine=EXCEL_ENGINE, engine_kwargs=EXCEL_ENGINE_KWARGS)
+
+    _put_buffer(cos, bucket_name, key, buf)
+
+
+def save_workbook_to_cos(
+    sheets: dict[str, pd.DataFrame],
+    key: str,
+    bucket: str | None = None,
+) -> None:
+    """
+    複数の DataFrame を 1 つの Excel（シート名 → DataFrame）にまとめて COS に保存する。
+    - ZIP 圧縮と PUT が 1 回で済む。
+    """
+    cos = get_cos_client()
+    bucket_name = bucket or COS_CONFIG["BUCKET_DEFAULT"]
+
+    # DataFrame 群 → Excelバイナリ（メモリ上）
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine=EXCEL_ENGINE, engine_kwargs=EXCEL_ENGINE_KWARGS) as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+    _put_buffer(cos, bucket_name, key, buf)
+
+
+def _unique_columns(columns: pd.Index) -> list[str]:
+    """
+    重複した列名を一意にした列名リストを返す。
+    - 1 回目に出てくる列名はそのまま使う。
+    - 2 回目以降は「列名_2」「列名_3」… のうち、まだ使われていない名前を付ける。
+    """
+    used = set(columns)
+    seen = set()
+    unique = []
+    for col in columns:
+        if col not in seen:
+            seen.add(col)
+            unique.append(col)
+            continue
+        n = 2
+        while f"{col}_{n}" in used:
+            n += 1
+        name = f"{col}_{n}"
+        used.add(name)
+        unique.append(name)
+    return unique
+
+
+def save_forecast_parquet_to_cos(
+    df: pd.DataFrame,
+    key: str,
+    bucket: str | None = None,
+) -> None:
+    """
+    DataFrame を Parquet 形式（zstd 圧縮）にして COS に保存する。
+    Excel が不要な後続処理向け。
+    - Parquet は列名の重複を許さないため、2 回目以降に出てくる列名は「列名_2」のように変更して保存する。
+      Forecast テーブルは build_forecast_table(df, internal_header=True) で重複のない列名にしてから渡す。
+    """
+    cos = get_cos_client()
+    bucket_name = bucket or COS_CONFIG["BUCKET_DEFAULT"]
+
+    # DataFrame → Parquetバイナリ（メモリ上）
+    buf = io.BytesIO()
+    df.set_axis(_unique_columns(df.columns), axis=1).to_parquet(
+        buf, engine="pyarrow", compression="zstd", index=False
+    )
 
-    cos.put_object(Bucket=bucket_name, Key=key, Body=buf.getvalue())
\ No newline at end of file
+    _put_buffer(cos, bucket_name, key, buf)
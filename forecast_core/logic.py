@@ -1,6 +1,80 @@
 import pandas as pd
 import numpy as np
 
+# メーカ名が IBM に該当するかの判定パターン
+IBM_MAKER_PATTERN = r"IBM|アイ・ビー・エム"
+
+# IBM ソフトウェア型番の SKU 先頭文字
+SOFTWARE_SKU_PREFIXES = np.array(["D", "E", "X", "Y"], dtype="U1")
+
+# 見積作成日の標準形式
+QUOTE_DATE_FORMAT = "%Y/%m/%d"
+
+
+def _as_string(s: pd.Series) -> pd.Series:
+    """
+    文字列型 (string / string[pyarrow]) でも category 型でもなければ string 型に変換する。
+    - io 側で Arrow 文字列型に変換済みの列は、そのまま Arrow のカーネルで処理させる。
+    - category 型の列は、.str の処理がカテゴリ値ごとに 1 回だけ実行されるのでそのまま使う。
+    """
+    if isinstance(s.dtype, pd.StringDtype):
+        return s
+    if isinstance(s.dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(s.cat.categories):
+        return s
+    return s.astype("string")
+
+
+def _as_quote_id(s: pd.Series) -> pd.Series:
+    """
+    見積No を Int64 に変換する。
+    数値化できない値（英字入りの番号など）が含まれる場合は、別案件が同じ欠損値に
+    まとめられてしまうため、元の列をそのまま返す。
+    """
+    ids = pd.to_numeric(s, errors="coerce")
+    if ids.notna().sum() != s.notna().sum():
+        return s
+    try:
+        return ids.astype("Int64")
+    except (TypeError, ValueError):
+        # 小数を含むなど、整数に丸めると値が変わる場合
+        return s
+
+
+def _parse_quote_date(s: pd.Series) -> pd.Series:
+    """
+    見積作成日を datetime に変換する。
+    - 見積データの標準形式 (YYYY/MM/DD) は format 指定の高速パスで一括変換する。
+    - そこで変換できなかった値（別形式の日付など）だけを、1 件ずつの推測解析に回す。
+      数値 (20240105 など) も文字列として解析し、UTC オフセットは除いて記載どおりの日時とする。
+    - どちらでも変換できない値は NaT とする。
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+
+    if pd.api.types.is_numeric_dtype(s):
+        # 欠損を含むと float になるため、20240105.0 → 20240105 に戻してから文字列化する
+        s = s.round().astype("Int64")
+    text = s.astype("string")
+    dt = pd.to_datetime(text, format=QUOTE_DATE_FORMAT, errors="coerce")
+    retry = dt.isna() & text.notna()
+    if retry.any():
+        local_text = text[retry].str.strip().str.replace(
+            r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)\s*(?:Z|UTC|GMT|[+-]\d{2}:?\d{2})$",
+            r"\1",
+            regex=True,
+        )
+        try:
+            fallback = pd.to_datetime(local_text, format="mixed", errors="coerce")
+        except ValueError:
+            # 除けない表記（"+09" など）のタイムゾーンが行ごとに異なる場合は UTC にそろえて解析する
+            fallback = pd.to_datetime(local_text, format="mixed", errors="coerce", utc=True)
+        # 上記で除けない表記のタイムゾーンが残った場合も、naive な日時にそろえる
+        if getattr(fallback.dtype, "tz", None) is not None:
+            fallback = fallback.dt.tz_localize(None)
+        # 1回目の結果へ直接代入すると dtype（単位）の違いで失敗するため、where で合成する
+        dt = dt.where(~retry, fallback.reindex(dt.index))
+    return dt
+
 
 def filter_ibm_manufacturer(quotes_df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -12,16 +86,14 @@ def filter_ibm_manufacturer(quotes_df: pd.DataFrame) -> pd.DataFrame:
       - 日本IBM
       - 日本アイ・ビー・エム株式会社
     """
-    df = quotes_df.copy()
+    df = quotes_df
     if "メーカ名" not in df.columns:
         raise KeyError("列『メーカ名』が見積データに存在しません。")
 
-    patterns = ["日本アイ・ビー・エム", "日本IBM", "日本アイ・ビー・エム株式会社"]
-    mask = df["メーカ名"].isin(patterns)
-
-    # 念のため、表記ゆれで取りこぼしがある場合に備えて contains("IBM") も補助的に追加
-    extra_mask = df["メーカ名"].astype(str).str.contains("IBM", na=False)
-    df_filtered = df[mask | extra_mask].reset_index(drop=True)
+    # 上記の表記はすべて「IBM」か「アイ・ビー・エム」を含むため、1 回の正規表現で判定する
+    # （表記ゆれで取りこぼしがある場合に備えた contains("IBM") もこれに含まれる）
+    mask = _as_string(df["メーカ名"]).str.contains(IBM_MAKER_PATTERN, regex=True, na=False)
+    df_filtered = df[mask].reset_index(drop=True)
 
     return df_filtered
 
@@ -30,12 +102,11 @@ def attach_sku(quotes_df: pd.DataFrame) -> pd.DataFrame:
     """
     メーカ型番の先頭7桁を SKU として追加する。
     """
-    df = quotes_df.copy()
-    if "メーカ型番" not in df.columns:
+    if "メーカ型番" not in quotes_df.columns:
         raise KeyError("列『メーカ型番』が見積データに存在しません。")
 
-    df["SKU"] = df["メーカ型番"].astype(str).str.slice(0, 7)
-    return df
+    # 入力は書き換えず、assign で SKU 列付きの新しい DataFrame を返す
+    return quotes_df.assign(SKU=_as_string(quotes_df["メーカ型番"]).str.slice(0, 7))
 
 
 def attach_brand_and_license(
@@ -45,21 +116,43 @@ def attach_brand_and_license(
     """
     型番マスタ (PAシート) から ブランド / ライセンス形態 / ライセンスカテゴリー を付与する。
     - JOINキーは SKU（パーツ番号の先頭7桁）とする。
+    - 同じ SKU に異なる ブランド / ライセンス形態 がある場合はどれとも決められないため、
+      空欄にして needs_review（ブランド / ライセンスカテゴリー 未設定）に回す。
     """
-    df = quotes_df.copy()
-    master = master_df.copy()
-
     required_cols = ["パーツ番号", "ブランド", "ライセンス形態"]
-    missing = [c for c in required_cols if c not in master.columns]
+    missing = [c for c in required_cols if c not in master_df.columns]
     if missing:
         raise KeyError(f"型番マスタに必要な列がありません: {missing}")
 
-    # マスタ側にも SKU 列を作成
-    master["SKU"] = master["パーツ番号"].astype(str).str.slice(0, 7)
-
-    master_small = master[["SKU", "ブランド", "ライセンス形態"]].drop_duplicates()
-
-    df = df.merge(master_small, on="SKU", how="left")
+    # マスタ側にも SKU 列を作成（必要な列だけを取り出してから付与する）
+    # 内容が同じ行は 1 行にまとめる
+    master_small = (
+        master_df[["ブランド", "ライセンス形態"]]
+        .assign(SKU=_as_string(master_df["パーツ番号"]).str.slice(0, 7))
+        .dropna(subset=["SKU"])
+        .drop_duplicates()
+    )
+
+    # それでも SKU が重複する（内容が食い違う）場合は、SKU ごとに 1 行にしたうえで
+    # ブランド / ライセンス形態 を空欄にする（JOIN で明細行が増えないようにする）
+    conflict_skus = master_small.loc[master_small["SKU"].duplicated(), "SKU"]
+    master_small = master_small.drop_duplicates("SKU")
+    is_conflict = master_small["SKU"].isin(conflict_skus).to_numpy()
+    master_small = master_small.assign(
+        ブランド=master_small["ブランド"].mask(is_conflict),
+        ライセンス形態=master_small["ライセンス形態"].mask(is_conflict),
+    )
+
+    # SKU 文字列ではなく、両側をまとめて factorize した整数コードで JOIN する
+    n_quotes = len(quotes_df)
+    codes, _ = pd.factorize(
+        pd.concat([quotes_df["SKU"], master_small["SKU"]], ignore_index=True)
+    )
+    left = quotes_df.assign(_sku_id=codes[:n_quotes])
+    right = master_small.drop(columns="SKU").assign(_sku_id=codes[n_quotes:])
+
+    # merge は新しい DataFrame を返すので、以降の列追加で入力は変更されない
+    df = left.merge(right, on="_sku_id", how="left", validate="m:1").drop(columns="_sku_id")
 
     # ひとまず ライセンスカテゴリー = ライセンス形態 として扱う
     df["ライセンスカテゴリー"] = df["ライセンス形態"]
@@ -72,15 +165,22 @@ def filter_ibm_software(df: pd.DataFrame) -> pd.DataFrame:
     IBMソフトウェア型番だけに絞り込む。
       - SKU 先頭が D/E/X/Y の行を残す。
     """
-    out = df.copy()
+    out = df
     if "SKU" not in out.columns:
         raise KeyError("列『SKU』が存在しません。先に attach_sku() を呼んでください。")
 
-    sku = out["SKU"].astype(str)
-    head = sku.str[0]
+    sku = _as_string(out["SKU"])
 
-    is_sw = head.isin(["D", "E", "X", "Y"])
-    filtered = out[is_sw].reset_index(drop=True)
+    if getattr(sku.dtype, "storage", None) == "pyarrow":
+        # Arrow 文字列型は先頭文字の切り出しと isin が Arrow のカーネルで処理される
+        is_sw = sku.str[0].isin(SOFTWARE_SKU_PREFIXES).to_numpy(dtype=bool, na_value=False)
+    else:
+        # それ以外は固定長 (U7) の NumPy 配列にし、1 文字単位 (U1) のビューから
+        # 各要素の先頭文字だけを取り出して判定する（欠損は空文字 → 対象外）
+        head = sku.to_numpy(dtype="U7", na_value="").view("U1")[::7]
+        is_sw = np.isin(head, SOFTWARE_SKU_PREFIXES)
+
+    filtered = out.iloc[is_sw].reset_index(drop=True)
     return filtered
 
 
@@ -89,26 +189,47 @@ def attach_amount_flag(quotes_df: pd.DataFrame) -> pd.DataFrame:
     見積No単位で小計を集計し、200万円UPフラグを明細行に付与する。
     - PDFマニュアルのピボットテーブル + IF 関数のロジックを再現。
     """
-    df = quotes_df.copy()
+    df = quotes_df
 
     required_cols = ["見積No", "小計"]
     missing = [c for c in required_cols if c not in df.columns]
     if missing:
         raise KeyError(f"200万円UPフラグ付与に必要な列がありません: {missing}")
 
-    # 見積No単位で小計を合計（IBM見積のHW+SWを合算する前提）
-    pivot = df.groupby("見積No", dropna=False)["小計"].sum()
+    # 見積No を整数キーにそろえて、文字列・混在型のハッシュを避ける
+    df = df.assign(見積No=_as_quote_id(df["見積No"]))
+
+    # 見積No単位で小計を合計し、各明細行に戻す（IBM見積のHW+SWを合算する前提）
+    totals = df.groupby("見積No", dropna=False, sort=False)["小計"].transform("sum")
 
     # 200万円「超」の案件にフラグ（IF(B3>2000000,"★","NG") 相当）
-    high_ids = pivot[pivot > 2_000_000].index
+    is_high = (totals > 2_000_000).to_numpy(dtype=bool, na_value=False)
+    return df.assign(**{"200万円UPフラグ": np.where(is_high, "★", "NG")})
 
-    df["200万円UPフラグ"] = df["見積No"].isin(high_ids).map({True: "★", False: "NG"})
-    return df
+
+def prepare_ibm_software_lines(
+    quotes_df: pd.DataFrame,
+    master_df: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    見積データから Forecast 対象の IBM ソフトウェア明細を作成する。
+    - IBM 絞り込み → 200万円UPフラグ → SKU 付与 → ソフトウェア絞り込み → マスタ JOIN の順に実行。
+    - ソフトウェア絞り込みを JOIN より前に行い、JOIN 対象の行数を減らす。
+    - 200万円UPフラグは HW+SW の合算で判定するため、ソフトウェア絞り込みより前に付与する。
+    """
+    df = filter_ibm_manufacturer(quotes_df)
+    df = attach_amount_flag(df)
+    df = attach_sku(df)
+    df = filter_ibm_software(df)
+    return attach_brand_and_license(df, master_df)
 
 
-def build_forecast_table(df: pd.DataFrame) -> pd.DataFrame:
+def build_forecast_table(df: pd.DataFrame, internal_header: bool = False) -> pd.DataFrame:
     """
     社内向け Forecast シートに近いフォーマットを作成する（詳細版）。
+    - internal_header=True の場合は、業務シートのヘッダーではなく内部の列名
+      （2 つ目の確度は「確度分類」、200万判定は「200万FLAG」）で返す。
+      業務シートのヘッダーは「確度」が重複するため、Parquet など列名の重複を許さない形式で保存する場合に使う。
 
     カラム構成（左から）:
       メーカ名 / 見積作成日 / 顧客名 / 担当営業 / アシスタント名 /
@@ -118,45 +239,43 @@ def build_forecast_table(df: pd.DataFrame) -> pd.DataFrame:
       時期 / 確度 / 200万円UPかどうかの判断（○/空欄）
     """
 
-    tmp = df.copy()
+    # 追加・変換する列はいったん new_cols に集め、最後に assign で 1 回だけ反映する
+    new_cols = {}
 
     # 見積No / 版数 を整数寄りに（.0 を消すため）
     for col in ["見積No", "版数"]:
-        if col in tmp.columns:
-            tmp[col] = pd.to_numeric(tmp[col], errors="coerce").astype("Int64")
-
-    # 時期: 見積作成日ベースの YYYY-MM
-    if "見積作成日" in tmp.columns:
-        tmp["時期"] = pd.to_datetime(tmp["見積作成日"], errors="coerce").dt.strftime("%Y-%m")
+        if col in df.columns:
+            new_cols[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+
+    # 時期: 見積作成日ベースの YYYY-MM（strftime を使わず年・月の整数から組み立てる）
+    if "見積作成日" in df.columns:
+        created = _parse_quote_date(df["見積作成日"]).dt
+        year = created.year.astype("Int64").astype("string")
+        month = created.month.astype("Int64").astype("string").str.zfill(2)
+        new_cols["時期"] = year + "-" + month
     else:
-        tmp["時期"] = np.nan
+        new_cols["時期"] = np.nan
 
     # 2つ目の「確度」用に簡易分類（雑に例示）
-    def classify_conf(x):
-        if pd.isna(x):
-            return ""
-        s = str(x)
-        if "受注" in s:
-            return "High"
-        if "概算" in s:
-            return "Low"
-        return ""
-
-    if "確度" in tmp.columns:
-        tmp["確度分類"] = tmp["確度"].apply(classify_conf)
+    #   「受注」を含む → High、「概算」を含む → Low、それ以外・欠損 → 空欄
+    if "確度" in df.columns:
+        conf = _as_string(df["確度"])
+        new_cols["確度分類"] = np.select(
+            [conf.str.contains("受注", regex=False, na=False),
+             conf.str.contains("概算", regex=False, na=False)],
+            ["High", "Low"],
+            default="",
+        )
     else:
-        tmp["確度分類"] = ""
+        new_cols["確度分類"] = ""
 
     # 200万フラグ → ○ / 空欄
-    def map_flag(v):
-        if v == "★":
-            return "○"
-        return ""
-
-    if "200万円UPフラグ" in tmp.columns:
-        tmp["200万FLAG"] = tmp["200万円UPフラグ"].map(map_flag)
+    if "200万円UPフラグ" in df.columns:
+        new_cols["200万FLAG"] = df["200万円UPフラグ"].map({"★": "○"}).fillna("")
     else:
-        tmp["200万FLAG"] = ""
+        new_cols["200万FLAG"] = ""
+
+    tmp = df.assign(**new_cols)
 
     cols_internal = [
         "メーカ名",
@@ -194,7 +313,9 @@ def build_forecast_table(df: pd.DataFrame) -> pd.DataFrame:
     if missing:
         raise KeyError(f"Forecastテーブル生成に必要な列が足りません: {missing}")
 
-    forecast = tmp[cols_internal].copy()
+    forecast = tmp[cols_internal]
+    if internal_header:
+        return forecast
 
     # 最終的なヘッダー（業務シートの1行目と同じ並び・名称）
     header = [
@@ -229,9 +350,7 @@ def build_forecast_table(df: pd.DataFrame) -> pd.DataFrame:
         "200万円UPかどうかの判断（実データは200万円以上の案件のみピックアップします）",
     ]
 
-    forecast.columns = header
-
-    return forecast
+    return forecast.set_axis(header, axis=1)
 
 
 def build_ibm_vad_forecast(df: pd.DataFrame) -> pd.DataFrame:
@@ -244,7 +363,7 @@ def build_ibm_vad_forecast(df: pd.DataFrame) -> pd.DataFrame:
       EU / 案件時期 / 案件確度 / その他コメント / 営業部確認 / PA番号 /
       カテゴリ / チャレンジ / 担当 / PGS
     """
-    d = df.copy()
+    d = df
 
     required_cols = [
         "見積作成日",
@@ -266,61 +385,26 @@ def build_ibm_vad_forecast(df: pd.DataFrame) -> pd.DataFrame:
         raise KeyError(f"VAD Forecast生成に必要な列が足りません: {missing}")
 
     # 200万円UP案件のみを対象（見積No単位で2,000,000超）
-    d = d[d["200万円UPフラグ"] == "★"].copy()
-
-    # EU（エンドユーザー名）
-    d["EU_internal"] = d["エンドユーザー名"]
+    d = d[d["200万円UPフラグ"] == "★"]
+
+    # 元データから転記する列（VAD の列名: 元の列名）
+    copied_cols = {
+        "見積作成日": "見積作成日",
+        "顧客名": "顧客名",
+        "担当営業": "担当営業",
+        "アシスタント名": "アシスタント名",
+        "見積No": "見積No",
+        "ブランド": "ブランド",
+        "SKU": "SKU",
+        "ライセンスカテゴリ": "ライセンスカテゴリー",
+        "商品名": "商品名",
+        "数量": "数量",
+        "小計": "小計",
+        "EU": "エンドユーザー名",
+    }
 
     # まだ持っていない項目はとりあえず空欄で出す
-    d["案件時期_internal"] = ""
-    d["案件確度_internal"] = ""
-    d["その他コメント_internal"] = ""
-    d["営業部確認_internal"] = ""
-    d["PA番号_internal"] = ""
-    d["カテゴリ_internal"] = ""
-    d["チャレンジ_internal"] = ""
-    d["担当_internal"] = ""
-    d["PGS_internal"] = ""
-
-    cols_internal = [
-        "見積作成日",
-        "顧客名",
-        "担当営業",
-        "アシスタント名",
-        "見積No",
-        "ブランド",
-        "SKU",
-        "ライセンスカテゴリー",
-        "商品名",
-        "数量",
-        "小計",
-        "EU_internal",
-        "案件時期_internal",
-        "案件確度_internal",
-        "その他コメント_internal",
-        "営業部確認_internal",
-        "PA番号_internal",
-        "カテゴリ_internal",
-        "チャレンジ_internal",
-        "担当_internal",
-        "PGS_internal",
-    ]
-
-    vad_df = d[cols_internal].copy()
-
-    header_vad = [
-        "見積作成日",
-        "顧客名",
-        "担当営業",
-        "アシスタント名",
-        "見積No",
-        "ブランド",
-        "SKU",
-        "ライセンスカテゴリ",
-        "商品名",
-        "数量",
-        "小計",
-        "EU",
+    blank_cols = [
         "案件時期",
         "案件確度",
         "その他コメント",
@@ -332,6 +416,14 @@ def build_ibm_vad_forecast(df: pd.DataFrame) -> pd.DataFrame:
         "PGS",
     ]
 
-    vad_df.columns = header_vad
+    # 空欄列は "" だけを持つ category 型にして、行数分の文字列配列を確保しない（1行1バイト）
+    blank = pd.Categorical.from_codes(np.zeros(len(d), dtype=np.int8), categories=[""])
+
+    vad_df = pd.DataFrame(
+        {
+            **{new: d[old] for new, old in copied_cols.items()},
+            **{col: blank for col in blank_cols},
+        }
+    )
 
     return vad_df
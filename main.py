@@ -1,17 +1,51 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 
 # ツール関数と型定義をインポート
-from tools.forecast_tool import generate_forecast, GenerateForecastInputs, GenerateForecastResult
+from tools.forecast_tool import run_generate_forecast, GenerateForecastInputs, GenerateForecastResult
+
+# uvicorn のワーカープロセス数（uvicorn 自身も WEB_CONCURRENCY を参照する）
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", 2)))
+
+# Forecast 生成（pandas / Excel 処理で CPU を使う）を実行するプロセス数
+# uvicorn ワーカー全体で CPU コア数を超えないよう、ワーカーごとのプロセス数を決める
+FORECAST_MAX_WORKERS = max(
+    1,
+    int(os.getenv("FORECAST_MAX_WORKERS", (os.cpu_count() or 1) // WEB_CONCURRENCY)),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # プロセスプールはインポート時ではなく起動時に作成する
+    # （spawn の子プロセスがこのモジュールを読み込んでも、プールは作られない）
+    executor = ProcessPoolExecutor(
+        max_workers=FORECAST_MAX_WORKERS,
+        # イベントループのスレッドを持つプロセスからの fork を避ける
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    app.state.executor = executor
+    try:
+        yield
+    finally:
+        # 終了時に子プロセスを片付ける
+        executor.shutdown(wait=False, cancel_futures=True)
+
 
 # アプリの定義
 app = FastAPI(
     title="Forecast Tool API",
     description="IBM Code Engine上で動作するForecast作成ツール",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # ルート（生存確認用）
@@ -21,10 +55,13 @@ def health_check():
 
 # ツールの実行エンドポイント
 @app.post("/generate_forecast", response_model=GenerateForecastResult)
-def run_forecast(inputs: GenerateForecastInputs):
+async def run_forecast(inputs: GenerateForecastInputs, request: Request):
     try:
-        # ツール関数を直接呼び出す
-        result = generate_forecast(inputs)
+        # ツール関数を別プロセスで実行し、その間もイベントループは他のリクエストを処理する
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            request.app.state.executor, run_generate_forecast, inputs
+        )
         return result
     except Exception as e:
         # エラー時は500エラーを返す
@@ -34,4 +71,5 @@ def run_forecast(inputs: GenerateForecastInputs):
 if __name__ == "__main__":
     # Code Engine は PORT 環境変数(デフォルト8080)で待機する
     port = int(os.getenv("PORT", 8080))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # 複数ワーカーで起動する場合、uvicorn にはアプリをインポート文字列で渡す
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=WEB_CONCURRENCY)
@@ -0,0 +1,47 @@
+import io
+
+import pandas as pd
+from ibm_botocore.response import StreamingBody
+
+import forecast_core.io as fio
+
+
+class FakeCOS:
+    """get_object だけを持つ COS クライアントの代替"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": StreamingBody(io.BytesIO(self.body), len(self.body))}
+
+
+def test_load_quotes_from_cos_decodes_cp932_stream(monkeypatch):
+    csv = "メーカ名,メーカ型番,見積No,小計\n日本アイ・ビー・エム,D0ABCDE-01,1,1500000\n"
+    monkeypatch.setattr(fio, "get_cos_client", lambda: FakeCOS(csv.encode("cp932")))
+
+    df = fio.load_quotes_from_cos("inputs/quotes.csv", bucket="bucket")
+
+    assert df["メーカ名"].tolist() == ["日本アイ・ビー・エム"]
+    assert df["メーカ型番"].tolist() == ["D0ABCDE-01"]
+    assert df["小計"].tolist() == [1500000]
+
+
+class FakePutCOS:
+    """put_object の Body を保持する COS クライアントの代替"""
+
+    def put_object(self, Bucket, Key, Body):
+        self.body = Body.read()
+
+
+def test_save_forecast_parquet_to_cos_renames_duplicate_columns(monkeypatch):
+    cos = FakePutCOS()
+    monkeypatch.setattr(fio, "get_cos_client", lambda: cos)
+    df = pd.DataFrame([[1, 2, 3, 4, 5]], columns=["a", "a", "a_2", "b", "b"])
+
+    fio.save_forecast_parquet_to_cos(df, key="outputs/forecast.parquet", bucket="bucket")
+
+    out = pd.read_parquet(io.BytesIO(cos.body))
+    # 付与する連番は、既存の列名（a_2）と重ならないものを選ぶ
+    assert list(out.columns) == ["a", "a_3", "a_2", "b", "b_2"]
+    assert out.iloc[0].tolist() == [1, 2, 3, 4, 5]
@@ -0,0 +1,157 @@
+import pandas as pd
+import pytest
+
+from forecast_core.logic import (
+    _as_quote_id,
+    _as_string,
+    _parse_quote_date,
+    attach_amount_flag,
+    attach_brand_and_license,
+    filter_ibm_software,
+)
+
+
+def test_parse_quote_date_standard_and_other_formats():
+    s = pd.Series(["2025/01/05", "2025/1/5", "2024-3-7", None, "bad"])
+
+    assert _parse_quote_date(s).tolist() == [
+        pd.Timestamp("2025-01-05"),
+        pd.Timestamp("2025-01-05"),
+        pd.Timestamp("2024-03-07"),
+        pd.NaT,
+        pd.NaT,
+    ]
+
+
+def test_parse_quote_date_int_yyyymmdd():
+    s = pd.Series([20240105, 20241231])
+
+    assert _parse_quote_date(s).tolist() == [
+        pd.Timestamp("2024-01-05"),
+        pd.Timestamp("2024-12-31"),
+    ]
+
+
+def test_parse_quote_date_float_yyyymmdd_with_missing():
+    s = pd.Series([20240105, None])
+
+    assert _parse_quote_date(s).tolist() == [pd.Timestamp("2024-01-05"), pd.NaT]
+
+
+def test_parse_quote_date_offset_iso_keeps_written_local_time():
+    s = pd.Series([
+        "2024-01-05T10:00:00+09:00",
+        "2024-02-01T00:00:00Z",
+        "2024/03/01",
+        "2024-01-05 10:00:00 +09:00",
+        "2024-01-05 10:00:00 UTC",
+    ])
+
+    parsed = _parse_quote_date(s)
+
+    assert pd.api.types.is_datetime64_dtype(parsed)
+    assert parsed.tolist() == [
+        pd.Timestamp("2024-01-05 10:00:00"),
+        pd.Timestamp("2024-02-01 00:00:00"),
+        pd.Timestamp("2024-03-01"),
+        pd.Timestamp("2024-01-05 10:00:00"),
+        pd.Timestamp("2024-01-05 10:00:00"),
+    ]
+
+
+def test_parse_quote_date_mixed_unstrippable_zones_stays_datetime():
+    # 時間だけのオフセットは除去対象外で、行ごとに異なると pandas は "Mixed timezones" を送出する
+    s = pd.Series(["2024-01-05T10:00:00+05", "2024-01-06T10:00:00+09", "2024/03/01"])
+
+    parsed = _parse_quote_date(s)
+
+    assert pd.api.types.is_datetime64_dtype(parsed)
+    assert parsed.dt.strftime("%Y-%m").tolist() == ["2024-01", "2024-01", "2024-03"]
+
+
+def test_parse_quote_date_offset_with_trailing_space():
+    s = pd.Series(["2024-01-05T10:00:00+05:00 ", "2024-01-06T10:00:00+09:00 "])
+
+    assert _parse_quote_date(s).tolist() == [
+        pd.Timestamp("2024-01-05 10:00:00"),
+        pd.Timestamp("2024-01-06 10:00:00"),
+    ]
+
+
+def test_attach_brand_and_license_blanks_conflicting_skus():
+    quotes = pd.DataFrame({"SKU": ["D123456", "E000001", "X999999"], "行": [1, 2, 3]})
+    master = pd.DataFrame({
+        "パーツ番号": ["D123456A", "D123456B", "E000001A", "E000001B"],
+        "ブランド": ["B1", "B1", "B2", "B2"],
+        "ライセンス形態": ["L1", "L2", "L3", "L3"],
+    })
+
+    out = attach_brand_and_license(quotes, master)
+
+    # 明細行は増えない
+    assert out["行"].tolist() == [1, 2, 3]
+    # D123456 は ライセンス形態 が食い違うので空欄、E000001 は同じ内容の重複なので付与される
+    assert out["ブランド"].isna().tolist() == [True, False, True]
+    assert out["ライセンス形態"].isna().tolist() == [True, False, True]
+    assert out.loc[1, "ブランド"] == "B2"
+    assert out.loc[1, "ライセンスカテゴリー"] == "L3"
+
+
+SKU_VALUES = ["D0ABCDE", "A1BBBBB", None, "", "E1", "XYZ1234567", "y0aaaaa", "Ｄ000000", "Y"]
+
+
+@pytest.mark.parametrize("dtype", ["string[python]", object])
+def test_filter_ibm_software_numpy_branch_matches_arrow_branch(dtype):
+    arrow = pd.DataFrame({"SKU": pd.Series(SKU_VALUES, dtype="string[pyarrow]"), "行": range(len(SKU_VALUES))})
+    other = arrow.assign(SKU=pd.Series(SKU_VALUES, dtype=dtype))
+
+    expected = filter_ibm_software(arrow)
+    # object 列は string 型に変換されるため、その変換先を python ストレージにして NumPy 側の分岐を通す
+    with pd.option_context("mode.string_storage", "python"):
+        assert _as_string(other["SKU"]).dtype.storage == "python"
+        result = filter_ibm_software(other)
+
+    assert result["行"].tolist() == expected["行"].tolist() == [0, 4, 5, 8]
+    assert result["SKU"].tolist() == ["D0ABCDE", "E1", "XYZ1234567", "Y"]
+    assert result.index.tolist() == [0, 1, 2, 3]
+
+
+def test_as_quote_id_numeric_ids_become_int64():
+    ids = _as_quote_id(pd.Series([1.0, 2.0, None, 2.0]))
+
+    assert ids.dtype == "Int64"
+    assert ids.tolist() == [1, 2, pd.NA, 2]
+    assert _as_quote_id(pd.Series(["10", "20"])).tolist() == [10, 20]
+
+
+def test_as_quote_id_keeps_alphanumeric_and_non_integral_ids():
+    alnum = pd.Series(["Q-1", "Q-2", "3"])
+    fractional = pd.Series([1.5, 2.0])
+
+    assert _as_quote_id(alnum) is alnum
+    assert _as_quote_id(fractional) is fractional
+
+
+def test_attach_amount_flag_groups_by_quote_id():
+    df = pd.DataFrame({
+        "見積No": ["Q-1", "Q-1", "Q-2", None, None, "3"],
+        "小計": [1_500_000, 600_000, 1_900_000, 1_200_000, 900_000, 2_500_000],
+    })
+
+    out = attach_amount_flag(df)
+
+    # Q-1 / Q-2 は別案件のまま集計され、見積No 欠損の行どうしは 1 案件として合算される
+    assert out["200万円UPフラグ"].tolist() == ["★", "★", "NG", "★", "★", "★"]
+    assert out["見積No"].equals(df["見積No"])
+
+
+def test_attach_amount_flag_numeric_ids_with_missing():
+    df = pd.DataFrame({
+        "見積No": [1.0, 1.0, 2.0, None, None],
+        "小計": [1_500_000, 600_000, 1_900_000, 1_200_000, 900_000],
+    })
+
+    out = attach_amount_flag(df)
+
+    assert out["見積No"].dtype == "Int64"
+    assert out["200万円UPフラグ"].tolist() == ["★", "★", "NG", "★", "★"]
@@ -0,0 +1,119 @@
+import pandas as pd
+import pytest
+
+import forecast_core.io as fio
+from forecast_core.logic import (
+    build_forecast_table,
+    build_ibm_vad_forecast,
+    prepare_ibm_software_lines,
+)
+
+QUOTE_ROWS = [
+    # メーカ名, 見積作成日, 見積No, メーカ型番, 小計, 確度
+    ("日本アイ・ビー・エム", "2025/01/10", 1, "D0AAAAA-01", 1_500_000, "受注"),
+    # Q1 の HW 行（SW ではないので除外されるが、200万円判定の合計には含める）
+    ("日本IBM", "2025/01/10", 1, "7X00ABC-HW", 800_000, "受注"),
+    # 型番マスタに存在しない SKU
+    ("日本アイ・ビー・エム株式会社", "2025-02-03", 2, "E1BBBBB-02", 1_000_000, "概算"),
+    # IBM 以外のメーカ
+    ("Dell", "2025/01/20", 3, "D0AAAAA-01", 5_000_000, "受注"),
+    ("IBM Japan", "2025/3/1", 4, "X2CCCCC", 2_100_000, None),
+]
+
+
+def make_quotes() -> pd.DataFrame:
+    df = pd.DataFrame(QUOTE_ROWS, columns=["メーカ名", "見積作成日", "見積No", "メーカ型番", "小計", "確度"])
+    return df.assign(
+        顧客名="顧客",
+        担当営業="営業A",
+        アシスタント名="アシスタントB",
+        版数=1,
+        件名="件名",
+        商品名="商品",
+        数量=1,
+        見積注意事項="",
+        納入期日="",
+        単価=1,
+        原単価=1,
+        粗利額=0,
+        原価小計=1,
+        粗利小計=0,
+        受注予定日="",
+        受注有無="",
+        エンドユーザー名="EU社",
+    )
+
+
+def make_master() -> pd.DataFrame:
+    return pd.DataFrame({
+        "パーツ番号": ["D0AAAAA01", "X2CCCCC", "7X00ABC"],
+        "ブランド": ["Cloud Pak", "Db2", "Power"],
+        "ライセンス形態": ["SaaS", "Perpetual", "HW"],
+    })
+
+
+def rows(df: pd.DataFrame, positions: list[int]) -> list[tuple]:
+    """列位置で取り出し、欠損を None にそろえた行のリストを返す"""
+    part = df.iloc[:, positions].astype(object)
+    return [tuple(None if pd.isna(v) else v for v in r) for r in part.itertuples(index=False)]
+
+
+@pytest.fixture(params=["raw", "loaded"])
+def inputs(request):
+    quotes, master = make_quotes(), make_master()
+    if request.param == "loaded":
+        # io.py の読み込み時と同じ dtype 変換（Arrow 文字列 / category）を通す
+        quotes = fio._optimize_dtypes(quotes, fio.QUOTES_STRING_COLS, fio.QUOTES_CATEGORY_COLS)
+        master = fio._optimize_dtypes(master, fio.MASTER_STRING_COLS, fio.MASTER_CATEGORY_COLS)
+    return quotes, master
+
+
+def test_pipeline_builds_expected_forecast_and_vad(inputs):
+    quotes, master = inputs
+    quotes_before, master_before = quotes.copy(), master.copy()
+
+    df = prepare_ibm_software_lines(quotes, master)
+    forecast = build_forecast_table(df)
+    vad = build_ibm_vad_forecast(df)
+
+    # 入力は変更されない
+    pd.testing.assert_frame_equal(quotes, quotes_before)
+    pd.testing.assert_frame_equal(master, master_before)
+
+    # メーカ名 / 見積No / ブランド / SKU / ライセンスカテゴリー / 小計 / 時期 / 確度(分類) / 200万判定
+    # （2 行目の見積作成日は標準形式と異なる "YYYY-MM-DD" だが、時期は解析される）
+    assert rows(forecast, [0, 5, 8, 10, 11, 14, 26, 27, 28]) == [
+        ("日本アイ・ビー・エム", 1, "Cloud Pak", "D0AAAAA", "SaaS", 1_500_000, "2025-01", "High", "○"),
+        ("日本アイ・ビー・エム株式会社", 2, None, "E1BBBBB", None, 1_000_000, "2025-02", "Low", ""),
+        ("IBM Japan", 4, "Db2", "X2CCCCC", "Perpetual", 2_100_000, "2025-03", "", "○"),
+    ]
+
+    assert list(vad.columns) == [
+        "見積作成日", "顧客名", "担当営業", "アシスタント名", "見積No", "ブランド", "SKU",
+        "ライセンスカテゴリ", "商品名", "数量", "小計", "EU", "案件時期", "案件確度",
+        "その他コメント", "営業部確認", "PA番号", "カテゴリ", "チャレンジ", "担当", "PGS",
+    ]
+    assert rows(vad, list(range(21))) == [
+        ("2025/01/10", "顧客", "営業A", "アシスタントB", 1, "Cloud Pak", "D0AAAAA",
+         "SaaS", "商品", 1, 1_500_000, "EU社", *[""] * 9),
+        ("2025/3/1", "顧客", "営業A", "アシスタントB", 4, "Db2", "X2CCCCC",
+         "Perpetual", "商品", 1, 2_100_000, "EU社", *[""] * 9),
+    ]
+
+    # 型番マスタに無い SKU だけが要確認
+    needs_review = df[df["ブランド"].isna() | df["ライセンスカテゴリー"].isna()]
+    assert needs_review["SKU"].tolist() == ["E1BBBBB"]
+
+
+def test_forecast_internal_header_is_unique(inputs):
+    quotes, master = inputs
+    df = prepare_ibm_software_lines(quotes, master)
+
+    forecast = build_forecast_table(df)
+    internal = build_forecast_table(df, internal_header=True)
+
+    # 業務シートのヘッダーは「確度」が重複するが、内部の列名は重複しない
+    assert forecast.columns.duplicated().any()
+    assert internal.columns.is_unique
+    assert list(internal.columns[-3:]) == ["時期", "確度分類", "200万FLAG"]
+    assert internal.to_numpy().tolist() == forecast.to_numpy().tolist()
@@ -1,6 +1,9 @@
 # tools/forecast_tool.py
 # 1行目にあった from __future__ ... は削除しました
 
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 from pydantic import BaseModel, Field
 # 正しいインポートパス
 from ibm_watsonx_orchestrate.agent_builder.tools import tool
@@ -9,13 +12,10 @@ from forecast_core.io import (
     load_quotes_from_cos,
     load_part_master_from_cos,
     save_forecast_to_cos,
+    save_workbook_to_cos,
 )
 from forecast_core.logic import (
-    filter_ibm_manufacturer,
-    attach_sku,
-    attach_brand_and_license,
-    filter_ibm_software,
-    attach_amount_flag,
+    prepare_ibm_software_lines,
     build_forecast_table,
     build_ibm_vad_forecast,
 )
@@ -34,10 +34,18 @@ class GenerateForecastInputs(BaseModel):
         default="outputs/",
         description="結果を出力するCOS上のフォルダパス"
     )
+    single_workbook: bool = Field(
+        default=True,
+        description="True の場合は forecast / vad_forecast / needs_review を1つのExcel（3シート）にまとめて保存し、False の場合は従来どおり3ファイルに分けて保存する"
+    )
 
 # --- 2. 出力の定義 ---
 class GenerateForecastResult(BaseModel):
-    """generate_forecast の戻り値"""
+    """
+    generate_forecast の戻り値
+    - single_workbook の場合、forecast_key / vad_forecast_key / needs_review_key は
+      すべて同じブックのキーになる（シート名は forecast / vad_forecast / needs_review）。
+    """
     quotes_key: str
     part_master_key: str
     forecast_key: str
@@ -66,34 +74,59 @@ def generate_forecast(inputs: GenerateForecastInputs) -> GenerateForecastResult:
     part_master_key = inputs.part_master_key
     output_prefix = inputs.output_prefix
 
-    # 1. COS から入力ファイルを読み込み
-    quotes_df = load_quotes_from_cos(quotes_key)
-    master_df = load_part_master_from_cos(part_master_key)
-
-    # 2. 業務ロジック適用
-    ibm_df = filter_ibm_manufacturer(quotes_df)
-    ibm_df = attach_amount_flag(ibm_df)
+    # 1. COS から入力ファイルを読み込み（ダウンロードと解析を2ファイル並列に実行）
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        quotes_future = ex.submit(load_quotes_from_cos, quotes_key)
+        master_future = ex.submit(load_part_master_from_cos, part_master_key)
+        quotes_df = quotes_future.result()
+        master_df = master_future.result()
 
-    df = attach_sku(ibm_df)
-    df = attach_brand_and_license(df, master_df)
-    df = filter_ibm_software(df)
+    # 2. 業務ロジック適用（マスタ JOIN 前に IBM ソフトウェア明細へ絞り込む）
+    df = prepare_ibm_software_lines(quotes_df, master_df)
 
     forecast_df = build_forecast_table(df)
     vad_df = build_ibm_vad_forecast(df)
-    needs_review_df = df[df["ブランド"].isna() | df["ライセンスカテゴリー"].isna()]
+    # ブランド / ライセンスカテゴリー のどちらかが未設定の行（1 本の bool 配列で位置指定）
+    needs_review_mask = np.logical_or(
+        df["ブランド"].isna().to_numpy(),
+        df["ライセンスカテゴリー"].isna().to_numpy(),
+    )
+    needs_review_df = df.iloc[needs_review_mask]
 
     # 3. COS に保存するキーを決定
     if not output_prefix.endswith("/"):
         output_prefix = output_prefix + "/"
 
-    forecast_key = output_prefix + "forecast.xlsx"
-    vad_key = output_prefix + "vad_forecast.xlsx"
-    needs_review_key = output_prefix + "needs_review.xlsx"
+    if inputs.single_workbook:
+        forecast_key = vad_key = needs_review_key = output_prefix + "forecast_all.xlsx"
+    else:
+        forecast_key = output_prefix + "forecast.xlsx"
+        vad_key = output_prefix + "vad_forecast.xlsx"
+        needs_review_key = output_prefix + "needs_review.xlsx"
 
     # 4. COS に保存
-    save_forecast_to_cos(forecast_df, key=forecast_key)
-    save_forecast_to_cos(vad_df, key=vad_key)
-    save_forecast_to_cos(needs_review_df, key=needs_review_key)
+    if inputs.single_workbook:
+        # 1つのブックにまとめて、ZIP 圧縮と PUT を1回で済ませる
+        save_workbook_to_cos(
+            {
+                "forecast": forecast_df,
+                "vad_forecast": vad_df,
+                "needs_review": needs_review_df,
+            },
+            key=forecast_key,
+        )
+    else:
+        # 3ファイルは独立しているので、Excel化とアップロードを並列に実行
+        jobs = [
+            (forecast_df, forecast_key),
+            (vad_df, vad_key),
+            (needs_review_df, needs_review_key),
+        ]
+        with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+            futures = [ex.submit(save_forecast_to_cos, out_df, key=key) for out_df, key in jobs]
+            # 例外があればここで呼び出し元に伝播させる
+            for f in futures:
+                f.result()
 
     # 5. 結果を返す
     return GenerateForecastResult(
@@ -105,4 +138,12 @@ def generate_forecast(inputs: GenerateForecastInputs) -> GenerateForecastResult:
         rows_total=int(len(df)),
         rows_vad=int(len(vad_df)),
         rows_needs_review=int(len(needs_review_df))
-    )
\ No newline at end of file
+    )
+
+
+def run_generate_forecast(inputs: GenerateForecastInputs) -> GenerateForecastResult:
+    """
+    プロセスプール上で generate_forecast を実行するための関数。
+    @tool で包まれたオブジェクトは pickle で参照渡しできないため、モジュール直下の関数から呼ぶ。
+    """
+    return generate_forecast(inputs)